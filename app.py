@@ -1,19 +1,23 @@
 import os
+import re
 import logging
 import sys
 import uuid
 import base64
 from io import BytesIO
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, abort
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
 from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import OperationalError
 
-from extensions import db  # ✅ your db object
-from ocr_processor import process_image
-from text_processor import extract_medical_entities
+from extensions import db, TESSDATA_PREFIX  # ✅ your db object
+from ocr_processor import process_image, process_pdf, PDF2IMAGE_AVAILABLE
+from text_processor import extract_medical_entities, enrich_with_spacy
 from document_manager import DocumentManager  # ✅ uses models correctly
 
 # --------------------- Logging Setup ---------------------
@@ -25,12 +29,17 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --------------------- Tesseract Path ---------------------
-tessdata_path = os.path.join(os.getcwd(), 'tessdata')
-if os.path.exists(tessdata_path):
-    os.environ['TESSDATA_PREFIX'] = tessdata_path
-    logger.info(f"TESSDATA_PREFIX set to {tessdata_path}")
+# Resolved once in extensions and shared with ocr_processor
+logger.info(f"TESSDATA_PREFIX: {TESSDATA_PREFIX}")
 
 # --------------------- Flask App Setup ---------------------
+# OCR runs single-threaded (OMP_THREAD_LIMIT=1, see ocr_processor), so scale
+# with gunicorn worker processes rather than Tesseract threads. A few gthread
+# request threads per worker overlap the waits on the tesseract subprocess and
+# SQLite commits, e.g.
+#   gunicorn --workers 4 --worker-class gthread --threads 4 --bind 0.0.0.0:5000 main:app
+# Each worker also has its own PDF page pool of OCR_POOL_WORKERS processes
+# (default a quarter of the CPUs); lower it when running more workers
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
@@ -40,8 +49,26 @@ app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///your_database.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
+# SQLite tuning: WAL lets readers proceed during commits, synchronous=NORMAL
+# is durable under WAL, and mmap avoids read() copies of database pages
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
 # Import models only after db is ready
 with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
     from models import Document
     db.create_all()
     logger.info("Database tables created")
@@ -52,8 +79,87 @@ logger.info(f"Database URL: {os.environ.get('DATABASE_URL')}")
 document_manager = DocumentManager()
 
 # Upload settings
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tiff', 'pdf'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tiff'}
+# PDFs are only accepted when the optional pdf2image package is installed
+if PDF2IMAGE_AVAILABLE:
+    ALLOWED_EXTENSIONS.add('pdf')
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+UPLOAD_FOLDER = os.path.join(app.root_path, 'uploads')
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+# --------------------- Schema Migration ---------------------
+# db.create_all() creates missing tables but never alters existing ones, so
+# columns added since a database was created are added here
+DOCUMENT_COLUMN_MIGRATIONS = (
+    ('image_path', "ALTER TABLE document ADD COLUMN image_path VARCHAR(512)"),
+    ('status', "ALTER TABLE document ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT 'completed'"),
+)
+
+def _document_columns():
+    return {column['name'] for column in inspect(db.engine).get_columns('document')}
+
+def migrate_document_table():
+    """Add missing document columns and move images stored in the row to the upload folder."""
+    columns = _document_columns()
+    for name, ddl in DOCUMENT_COLUMN_MIGRATIONS:
+        if name in columns:
+            continue
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text(ddl))
+            logger.info(f"Added document.{name} column")
+        except OperationalError:
+            # Another worker may have added it first
+            if name not in _document_columns():
+                raise
+    if 'image_data' in columns:
+        _export_image_data()
+
+def _export_image_data():
+    """Write base64 images from the old image_data column to files and point image_path at them."""
+    with db.engine.begin() as connection:
+        rows = connection.execute(text(
+            "SELECT id, name FROM document WHERE image_data IS NOT NULL AND image_path IS NULL"
+        )).fetchall()
+    exported = 0
+    for document_id, name in rows:
+        extension = name.rsplit('.', 1)[1].lower() if name and '.' in name else ''
+        if extension not in ALLOWED_EXTENSIONS:
+            extension = 'jpg'
+        image_path = os.path.join(UPLOAD_FOLDER, f"{document_id}.{extension}")
+        try:
+            with db.engine.begin() as connection:
+                image_data = connection.execute(
+                    text("SELECT image_data FROM document WHERE id = :id"), {'id': document_id}
+                ).scalar()
+                image_bytes = base64.b64decode(image_data)
+                with open(image_path, 'wb') as f:
+                    f.write(image_bytes)
+                connection.execute(
+                    text("UPDATE document SET image_path = :path, image_data = NULL WHERE id = :id"),
+                    {'path': image_path, 'id': document_id}
+                )
+            exported += 1
+        except Exception as e:
+            logger.error(f"Error exporting stored image of document {document_id}: {str(e)}")
+    if exported:
+        logger.info(f"Exported {exported} stored images to {UPLOAD_FOLDER}")
+
+with app.app_context():
+    migrate_document_table()
+
+# Background OCR jobs; Tesseract and SQLite release the GIL, so threads overlap.
+# The queue lives in this process only and is not durable: jobs queued or
+# running when the worker exits (restart, reload, max-requests recycling,
+# autoscale scale-down) are lost. Their documents would stay 'processing', so
+# any still processing after OCR_JOB_TIMEOUT seconds are marked failed when a
+# worker starts and when their status is polled
+OCR_JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', 2))
+OCR_JOB_TIMEOUT = int(os.environ.get('OCR_JOB_TIMEOUT', 600))
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_JOB_WORKERS)
+
+with app.app_context():
+    document_manager.fail_stale_documents(OCR_JOB_TIMEOUT)
 
 # --------------------- Routes ---------------------
 
@@ -64,6 +170,93 @@ def index():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Base64 characters decoded per write; a multiple of 4 keeps chunks aligned
+# once line breaks and other whitespace are removed
+BASE64_CHUNK_SIZE = 64 * 1024
+WHITESPACE_RE = re.compile(r'\s')
+
+def image_path_for(document_id, extension):
+    return os.path.join(UPLOAD_FOLDER, f"{document_id}.{extension}")
+
+def save_base64_image(image_path, image_data, start=0):
+    """Decode base64 image data from offset start to a file chunk by chunk."""
+    # Line-wrapped data would shift the chunks off 4-character boundaries
+    if WHITESPACE_RE.search(image_data, start):
+        image_data, start = ''.join(image_data[start:].split()), 0
+    try:
+        with open(image_path, 'wb') as f:
+            for offset in range(start, len(image_data), BASE64_CHUNK_SIZE):
+                f.write(base64.b64decode(image_data[offset:offset + BASE64_CHUNK_SIZE]))
+    except Exception:
+        # Don't leave a partial image behind
+        if os.path.exists(image_path):
+            os.remove(image_path)
+        raise
+    return image_path
+
+def _run_ocr_job(document_id, document_type, image_path):
+    """Background job: OCR a saved image, extract entities and store the results."""
+    with app.app_context():
+        try:
+            if image_path.endswith('.pdf'):
+                ocr_text = process_pdf(image_path)
+            else:
+                ocr_text = process_image(image_path)
+            processed_data = extract_medical_entities(ocr_text, document_type)
+            document_manager.update_document(document_id, {
+                'raw_text': ocr_text,
+                'processed_data': processed_data,
+                'status': 'completed'
+            })
+        except Exception as e:
+            logger.error(f"Error in OCR job for document {document_id}: {str(e)}")
+            document_manager.update_document(document_id, {'status': 'failed'})
+
+def _with_spacy_entities(doc):
+    """Add spaCy entities, skipped at ingest, to a document's processed data."""
+    if doc.get('status') == 'completed':
+        doc['processed_data'] = enrich_with_spacy(doc['processed_data'], doc.get('raw_text'), doc['type'])
+    return doc
+
+def _store_document(document_id, name, document_type, image_path):
+    """Record the saved image as a pending document and queue it for OCR."""
+    document_manager.add_document({
+        'id': document_id,
+        'name': name,
+        'type': document_type,
+        'created_at': datetime.now().isoformat(),
+        'processed_data': {},
+        'image_path': image_path,
+        'status': 'processing'
+    })
+    ocr_executor.submit(_run_ocr_job, document_id, document_type, image_path)
+    return document_id
+
+def _handle_upload(file, document_type):
+    document_id = str(uuid.uuid4())
+    filename = secure_filename(file.filename)
+    # The extension comes from the name allowed_file checked: secure_filename
+    # drops non-ASCII characters and can leave no dot behind
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    # Stream the upload to disk rather than reading it into memory
+    image_path = image_path_for(document_id, extension)
+    file.save(image_path)
+    return _store_document(document_id, filename, document_type, image_path)
+
+def _handle_camera(data_url, document_type):
+    document_id = str(uuid.uuid4())
+    # Decode past the "data:image/jpeg;base64," header without copying the payload
+    image_path = save_base64_image(image_path_for(document_id, 'jpg'), data_url, data_url.find(',') + 1)
+    name = f"{document_type}{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
+    return _store_document(document_id, name, document_type, image_path)
+
+def _accepted(document_id):
+    """202 with a status URL for API clients; browsers go to the document page."""
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        status_url = url_for('document_status', document_id=document_id)
+        return jsonify({'id': document_id, 'status': 'processing', 'status_url': status_url}), 202, {'Location': status_url}
+    return redirect(url_for('view_document', document_id=document_id))
+
 @app.route('/process', methods=['POST'])
 def process_document():
     try:
@@ -72,7 +265,6 @@ def process_document():
             return redirect(request.url)
 
         document_type = request.form.get('document_type', 'prescription')
-        document_id = str(uuid.uuid4())
 
         # File Upload
         if 'file' in request.files:
@@ -81,39 +273,11 @@ def process_document():
                 flash('No selected file', 'error')
                 return redirect(request.url)
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_data = file.read()
-                ocr_text = process_image(file_data)
-                processed_data = extract_medical_entities(ocr_text, document_type)
-                document = {
-                    'id': document_id,
-                    'name': filename,
-                    'type': document_type,
-                    'created_at': datetime.now().isoformat(),
-                    'raw_text': ocr_text,
-                    'processed_data': processed_data,
-                    'image_data': base64.b64encode(file_data).decode('utf-8')
-                }
-                document_manager.add_document(document)
-                return redirect(url_for('view_document', document_id=document_id))
+                return _accepted(_handle_upload(file, document_type))
 
         # Camera Capture
         elif 'image_data' in request.form:
-            image_data = request.form['image_data'].split(',')[1] if ',' in request.form['image_data'] else request.form['image_data']
-            image_bytes = base64.b64decode(image_data)
-            ocr_text = process_image(image_bytes)
-            processed_data = extract_medical_entities(ocr_text, document_type)
-            document = {
-                'id': document_id,
-                'name': f"{document_type}{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg",
-                'type': document_type,
-                'created_at': datetime.now().isoformat(),
-                'raw_text': ocr_text,
-                'processed_data': processed_data,
-                'image_data': image_data
-            }
-            document_manager.add_document(document)
-            return redirect(url_for('view_document', document_id=document_id))
+            return _accepted(_handle_camera(request.form['image_data'], document_type))
 
         flash('Invalid file type.', 'error')
         return redirect(request.url)
@@ -123,6 +287,19 @@ def process_document():
         flash(f"Error: {str(e)}", 'error')
         return redirect(url_for('index'))
 
+@app.route('/document/<document_id>/status')
+def document_status(document_id):
+    doc = document_manager.get_document(document_id)
+    if not doc:
+        return jsonify({'id': document_id, 'status': 'not_found'}), 404
+    if doc['status'] == 'processing' and document_manager.fail_stale_documents(OCR_JOB_TIMEOUT, document_id):
+        doc['status'] = 'failed'
+    return jsonify({
+        'id': document_id,
+        'status': doc['status'],
+        'url': url_for('view_document', document_id=document_id)
+    })
+
 @app.route('/documents')
 def documents():
     return render_template('documents.html', documents=document_manager.get_all_documents())
@@ -133,7 +310,14 @@ def view_document(document_id):
     if not doc:
         flash("Document not found", "error")
         return redirect(url_for('documents'))
-    return render_template('document_view.html', document=doc)
+    return render_template('document_view.html', document=_with_spacy_entities(doc))
+
+@app.route('/image/<document_id>')
+def document_image(document_id):
+    doc = document_manager.get_document(document_id)
+    if not doc or not doc.get('image_path') or not os.path.exists(doc['image_path']):
+        abort(404)
+    return send_file(doc['image_path'])
 
 @app.route('/document/<document_id>/export', methods=['GET'])
 def export_document(document_id):
@@ -141,11 +325,12 @@ def export_document(document_id):
     if not doc:
         flash("Document not found", "error")
         return redirect(url_for('documents'))
+    doc = _with_spacy_entities(doc)
 
     format_type = request.args.get('format', 'json')
     if format_type == 'json':
         export_data = doc.copy()
-        export_data.pop('image_data', None)
+        export_data.pop('image_path', None)
         return jsonify(export_data)
     elif format_type == 'txt':
         result = f"Document: {doc['name']}\nType: {doc['type']}\nCreated: {doc['created_at']}\n\n"
@@ -176,7 +361,7 @@ def delete_document(document_id):
 @app.route('/profile')
 def profile():
     stats = {
-        'total': len(document_manager.get_all_documents()),
+        'total': document_manager.count_all(),
         'by_type': document_manager.get_document_type_counts()
     }
     return render_template('profile.html', stats=stats)
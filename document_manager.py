@@ -1,17 +1,27 @@
 # document_manager.py
 import logging
 import json
-from datetime import datetime
-from collections import Counter
+import os
+import time
+from datetime import datetime, timedelta
 from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from extensions import db
 from models import Document
 
 logger = logging.getLogger(__name__)
 
+# Seconds that aggregate statistics may be served from cache
+STATS_CACHE_TTL = 30
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
 class DocumentManager:
     def __init__(self):
-        self.documents = {}
+        self._stats_cache = {}
         logger.debug("Document Manager initialized")
 
     def add_document(self, document):
@@ -19,28 +29,25 @@ class DocumentManager:
         if not document_id:
             raise ValueError("Document must have an ID")
 
-        self.documents[document_id] = document
-
         try:
-            existing_doc = Document.query.get(document_id)
-            if existing_doc:
-                existing_doc.name = document.get('name')
-                existing_doc.type = document.get('type')
-                existing_doc.raw_text = document.get('raw_text')
-                existing_doc.image_data = document.get('image_data')
-                existing_doc.set_processed_data(document.get('processed_data', {}))
+            values = {
+                'name': document.get('name'),
+                'type': document.get('type'),
+                'raw_text': document.get('raw_text'),
+                'processed_data': Document.encode_processed_data(document.get('processed_data', {})),
+                'image_path': document.get('image_path'),
+                'status': document.get('status', 'completed')
+            }
+            # Single INSERT ... ON CONFLICT DO UPDATE instead of SELECT then INSERT/UPDATE
+            # where the dialect has it; merge does the SELECT elsewhere
+            insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+            if insert is not None:
+                stmt = insert(Document).values(id=document_id, **values)
+                db.session.execute(stmt.on_conflict_do_update(index_elements=[Document.id], set_=values))
             else:
-                db_document = Document(
-                    id=document_id,
-                    name=document.get('name'),
-                    type=document.get('type'),
-                    raw_text=document.get('raw_text'),
-                    image_data=document.get('image_data')
-                )
-                db_document.set_processed_data(document.get('processed_data', {}))
-                db.session.add(db_document)
-
+                db.session.merge(Document(id=document_id, **values))
             db.session.commit()
+            self._stats_cache.clear()
             logger.debug(f"Added document to database with ID: {document_id}")
         except Exception as e:
             logger.error(f"Error storing document in database: {str(e)}")
@@ -50,7 +57,7 @@ class DocumentManager:
 
     def get_document(self, document_id):
         try:
-            db_document = Document.query.get(document_id)
+            db_document = db.session.get(Document, document_id)
             if db_document:
                 logger.debug(f"Retrieved document {document_id} from database")
                 return {
@@ -60,26 +67,22 @@ class DocumentManager:
                     'created_at': db_document.created_at.isoformat(),
                     'raw_text': db_document.raw_text,
                     'processed_data': db_document.get_processed_data(),
-                    'image_data': db_document.image_data
+                    'image_path': db_document.image_path,
+                    'status': db_document.status
                 }
         except Exception as e:
             logger.error(f"Error retrieving document from database: {str(e)}")
+            return None
 
-        document = self.documents.get(document_id)
-        if not document:
-            logger.warning(f"Document with ID {document_id} not found")
-        return document
+        logger.warning(f"Document with ID {document_id} not found")
+        return None
 
     def update_document(self, document_id, updates):
-        document = self.documents.get(document_id)
-        if document:
-            document.update(updates)
-
         try:
-            db_document = Document.query.get(document_id)
+            db_document = db.session.get(Document, document_id)
             if not db_document:
                 logger.warning(f"Cannot update document {document_id} in database: not found")
-                return document
+                return None
 
             if 'name' in updates:
                 db_document.name = updates['name']
@@ -89,157 +92,185 @@ class DocumentManager:
                 db_document.raw_text = updates['raw_text']
             if 'processed_data' in updates:
                 db_document.set_processed_data(updates['processed_data'])
-            if 'image_data' in updates:
-                db_document.image_data = updates['image_data']
+            if 'image_path' in updates:
+                db_document.image_path = updates['image_path']
+            if 'status' in updates:
+                db_document.status = updates['status']
 
             db.session.commit()
+            self._stats_cache.clear()
             logger.debug(f"Updated document in database with ID: {document_id}")
             return self.get_document(document_id)
         except Exception as e:
             logger.error(f"Error updating document in database: {str(e)}")
             db.session.rollback()
-            return document
+            return None
 
     def delete_document(self, document_id):
-        in_memory_deleted = False
-        if document_id in self.documents:
-            del self.documents[document_id]
-            in_memory_deleted = True
-
         try:
-            db_document = Document.query.get(document_id)
+            db_document = db.session.get(Document, document_id)
             if db_document:
+                image_path = db_document.image_path
                 db.session.delete(db_document)
                 db.session.commit()
+                self._stats_cache.clear()
                 logger.debug(f"Deleted document from database with ID: {document_id}")
+                self._remove_image(image_path)
                 return True
             else:
                 logger.warning(f"Document {document_id} not found in database for deletion")
-                return in_memory_deleted
+                return False
         except Exception as e:
             logger.error(f"Error deleting document from database: {str(e)}")
             db.session.rollback()
-            return in_memory_deleted
+            return False
+
+    @staticmethod
+    def _remove_image(image_path):
+        if not image_path:
+            return
+        try:
+            os.remove(image_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing image file {image_path}: {str(e)}")
+
+    # Columns needed to render document lists; raw_text and processed_data
+    # can be large and are only loaded for single-document views
+    LIST_COLUMNS = (Document.id, Document.name, Document.type, Document.created_at, Document.status)
+    SEARCH_COLUMNS = LIST_COLUMNS + (Document.raw_text, Document.processed_data, Document.image_path)
+
+    @staticmethod
+    def _summary_dict(row):
+        return {
+            'id': row.id,
+            'name': row.name,
+            'type': row.type,
+            'created_at': row.created_at.isoformat(),
+            'status': row.status
+        }
 
     def get_all_documents(self):
         documents = []
         try:
-            db_documents = Document.query.all()
-            for doc in db_documents:
-                documents.append({
-                    'id': doc.id,
-                    'name': doc.name,
-                    'type': doc.type,
-                    'created_at': doc.created_at.isoformat(),
-                    'raw_text': doc.raw_text,
-                    'processed_data': doc.get_processed_data(),
-                    'image_data': doc.image_data
-                })
+            rows = db.session.query(*self.LIST_COLUMNS).all()
+            documents = [self._summary_dict(row) for row in rows]
             logger.debug(f"Retrieved {len(documents)} documents from database")
         except Exception as e:
             logger.error(f"Error retrieving documents from database: {str(e)}")
-            documents = list(self.documents.values())
-            logger.debug(f"Falling back to {len(documents)} in-memory documents")
 
         return documents
 
     def get_documents_by_type(self, document_type):
         try:
-            db_documents = Document.query.filter_by(type=document_type).all()
-            documents = []
-            for doc in db_documents:
-                documents.append({
-                    'id': doc.id,
-                    'name': doc.name,
-                    'type': doc.type,
-                    'created_at': doc.created_at.isoformat(),
-                    'raw_text': doc.raw_text,
-                    'processed_data': doc.get_processed_data(),
-                    'image_data': doc.image_data
-                })
+            rows = db.session.query(*self.LIST_COLUMNS).filter(Document.type == document_type).all()
+            documents = [self._summary_dict(row) for row in rows]
             logger.debug(f"Retrieved {len(documents)} documents of type {document_type} from database")
             return documents
         except Exception as e:
             logger.error(f"Error retrieving documents by type from database: {str(e)}")
-            return [doc for doc in self.documents.values() if doc.get('type') == document_type]
+            return []
 
     def search_documents(self, query):
         query = query.lower()
         results = []
 
         try:
-            db_documents = Document.query.filter(Document.raw_text.ilike(f'%{query}%')).all()
-
-            for doc in db_documents:
-                doc_dict = {
-                    'id': doc.id,
-                    'name': doc.name,
-                    'type': doc.type,
-                    'created_at': doc.created_at.isoformat(),
-                    'raw_text': doc.raw_text,
-                    'processed_data': doc.get_processed_data(),
-                    'image_data': doc.image_data
-                }
-                if doc_dict['id'] not in [d['id'] for d in results]:
-                    results.append(doc_dict)
+            # processed_data is stored as JSON text, so ilike can prefilter it in
+            # SQL; rows that only matched there are re-checked against the values.
+            # SQLite's lower() only folds ASCII, and JSON escapes quotes,
+            # backslashes and control characters (and non-ASCII in older rows),
+            # so other queries are checked in Python against every row
+            rows = db.session.query(*self.SEARCH_COLUMNS)
+            if query.isascii() and json.dumps(query)[1:-1] == query:
+                pattern = f'%{query}%'
+                rows = rows.filter(or_(
+                    Document.raw_text.ilike(pattern),
+                    Document.processed_data.ilike(pattern)
+                ))
+            rows = rows.all()
 
-            db_docs = Document.query.all()
-            for doc in db_docs:
-                if doc.id in [d['id'] for d in results]:
+            for row in rows:
+                processed_data = json.loads(row.processed_data) if row.processed_data else {}
+                if query not in (row.raw_text or '').lower() and \
+                        not self._processed_data_matches(processed_data, query):
                     continue
 
-                processed_data = doc.get_processed_data()
-                found = False
-                for key, value in processed_data.items():
-                    if isinstance(value, str) and query in value.lower():
-                        found = True
-                        break
-                    elif isinstance(value, list):
-                        for item in value:
-                            if isinstance(item, str) and query in item.lower():
-                                found = True
-                                break
-                        if found:
-                            break
-
-                if found:
-                    results.append({
-                        'id': doc.id,
-                        'name': doc.name,
-                        'type': doc.type,
-                        'created_at': doc.created_at.isoformat(),
-                        'raw_text': doc.raw_text,
-                        'processed_data': processed_data,
-                        'image_data': doc.image_data
-                    })
+                result = self._summary_dict(row)
+                result.update({
+                    'raw_text': row.raw_text,
+                    'processed_data': processed_data,
+                    'image_path': row.image_path
+                })
+                results.append(result)
 
             logger.debug(f"Found {len(results)} documents matching '{query}' in database")
         except Exception as e:
             logger.error(f"Error searching documents in database: {str(e)}")
-            for doc in self.documents.values():
-                if query in doc.get('raw_text', '').lower():
-                    results.append(doc)
-                    continue
-
-                processed_data = doc.get('processed_data', {})
-                for key, value in processed_data.items():
-                    if isinstance(value, str) and query in value.lower():
-                        results.append(doc)
-                        break
-                    elif isinstance(value, list):
-                        for item in value:
-                            if isinstance(item, str) and query in item.lower():
-                                results.append(doc)
-                                break
+            results = []
 
         return results
 
+    @staticmethod
+    def _processed_data_matches(processed_data, query):
+        for value in processed_data.values():
+            if isinstance(value, str) and query in value.lower():
+                return True
+            elif isinstance(value, list):
+                if any(isinstance(item, str) and query in item.lower() for item in value):
+                    return True
+        return False
+
+    def fail_stale_documents(self, max_age, document_id=None):
+        """
+        Mark documents still 'processing' after max_age seconds as failed, all
+        of them or only document_id. Returns the number of documents marked.
+        """
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+            stale = db.session.query(Document).filter(
+                Document.status == 'processing',
+                Document.created_at < cutoff
+            )
+            if document_id is not None:
+                stale = stale.filter(Document.id == document_id)
+            count = stale.update({Document.status: 'failed'}, synchronize_session=False)
+            db.session.commit()
+            if count:
+                self._stats_cache.clear()
+                logger.warning(f"Marked {count} stale processing documents as failed")
+            return count
+        except Exception as e:
+            logger.error(f"Error failing stale documents in database: {str(e)}")
+            db.session.rollback()
+            return 0
+
+    def _cached_stat(self, key, compute):
+        cached = self._stats_cache.get(key)
+        now = time.monotonic()
+        if cached and now - cached[0] < STATS_CACHE_TTL:
+            return cached[1]
+        value = compute()
+        self._stats_cache[key] = (now, value)
+        return value
+
+    def count_all(self):
+        try:
+            return self._cached_stat(
+                'count_all',
+                lambda: db.session.query(func.count(Document.id)).scalar()
+            )
+        except Exception as e:
+            logger.error(f"Error counting documents in database: {str(e)}")
+            return 0
+
     def get_document_type_counts(self):
         try:
-            from sqlalchemy import func
-            type_counts = db.session.query(Document.type, func.count(Document.id)).group_by(Document.type).all()
-            return dict(type_counts)
+            return self._cached_stat(
+                'type_counts',
+                lambda: dict(db.session.query(Document.type, func.count(Document.id)).group_by(Document.type).all())
+            )
         except Exception as e:
             logger.error(f"Error getting document type counts from database: {str(e)}")
-            types = [doc.get('type') for doc in self.documents.values()]
-            return dict(Counter(types))
+            return {}
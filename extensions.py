@@ -1,3 +1,25 @@
-# extensions.py
-from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+# extensions.py
+import os
+from flask_sqlalchemy import SQLAlchemy
+db = SQLAlchemy()
+
+# Tesseract language data, resolved once per process: an explicit
+# TESSDATA_PREFIX wins, then the project's tessdata folder, then system paths
+TESSDATA_SEARCH_PATHS = [
+    os.path.join(os.getcwd(), 'tessdata'),
+    '/usr/share/tessdata',
+    '/usr/local/share/tessdata',
+    '/opt/homebrew/share/tessdata',
+]
+
+def _find_tessdata_prefix():
+    if os.environ.get('TESSDATA_PREFIX'):
+        return os.environ['TESSDATA_PREFIX']
+    for possible_path in TESSDATA_SEARCH_PATHS:
+        if os.path.isdir(possible_path):
+            return possible_path
+    return None
+
+TESSDATA_PREFIX = _find_tessdata_prefix()
+if TESSDATA_PREFIX:
+    os.environ['TESSDATA_PREFIX'] = TESSDATA_PREFIX
@@ -18,21 +18,28 @@ class Document(db.Model):
     """Document model for storing medical documents."""
     id = db.Column(db.String(36), primary_key=True)  # UUID as string
     name = db.Column(db.String(255), nullable=False)
-    type = db.Column(db.String(50), nullable=False)  # prescription, lab_report, etc.
+    type = db.Column(db.String(50), nullable=False, index=True)  # prescription, lab_report, etc.
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     raw_text = db.Column(db.Text)
     processed_data = db.Column(db.Text)  # JSON string of extracted medical entities
-    image_data = db.Column(db.Text)  # Base64 encoded image
+    image_path = db.Column(db.String(512))  # Path of the stored image file
+    status = db.Column(db.String(20), nullable=False, default='completed')  # processing, completed, failed
 
     # Foreign key to user
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Nullable for guest users
 
+    @staticmethod
+    def encode_processed_data(data_dict):
+        """Convert dictionary to the JSON string stored in processed_data."""
+        return json.dumps(data_dict, ensure_ascii=False)
+
     def set_processed_data(self, data_dict):
         """Convert dictionary to JSON string for storage."""
-        self.processed_data = json.dumps(data_dict)
+        self.processed_data = self.encode_processed_data(data_dict)
 
     def get_processed_data(self):
         """Convert JSON string to dictionary."""
+        # Not cached: each instance lives for one request and is read once
         if self.processed_data:
             return json.loads(self.processed_data)
         return {}
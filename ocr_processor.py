@@ -1,63 +1,171 @@
+import os
+
+# Tesseract's OpenMP threading is slower than single-threaded LSTM on typical
+# server cores and competes with gunicorn workers; must be set before import
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
 import cv2
 import numpy as np
 import pytesseract
 import logging
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import io
-import os
+
+from extensions import TESSDATA_PREFIX
+
+# tesserocr keeps the engine loaded in-process; without it every call goes
+# through pytesseract, which starts a tesseract subprocess and reloads the model
+try:
+    from tesserocr import PyTessBaseAPI, OEM
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+# pdf2image is optional; without it PDF uploads cannot be split into pages
+try:
+    from pdf2image import convert_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-# Set Tesseract configuration
-if not os.environ.get('TESSDATA_PREFIX'):
-    # Try to set TESSDATA_PREFIX to common locations
-    for possible_path in ['/usr/share/tessdata', '/usr/local/share/tessdata', 
-                          '/opt/homebrew/share/tessdata', './tessdata']:
-        if os.path.exists(possible_path):
-            os.environ['TESSDATA_PREFIX'] = possible_path
-            logger.info(f"Set TESSDATA_PREFIX to {possible_path}")
-            break
+# Tesseract configuration: one primary pass, one fallback on empty output
+# OEM 1 = Neural nets LSTM engine only
+# PSM 6 = Assume a single uniform block of text
+# PSM 3 = Fully automatic page segmentation, but no OSD
+OCR_ENGINE_MODE = 1
+PAGE_SEG_MODES = (6, 3)
+MIN_TEXT_LENGTH = 10
+
+# Per-process tesserocr engine; the API is not thread-safe, so calls are locked
+_tess_api = None
+_tess_lock = threading.Lock()
+
+def _reset_tess_after_fork():
+    # Pool workers are forked from a job thread while another job thread may
+    # hold the lock or be using the engine; the child gets neither
+    global _tess_api, _tess_lock
+    _tess_api = None
+    _tess_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_tess_after_fork)
+
+# Longest image side passed to Tesseract; more resolution costs time, not accuracy
+MAX_IMAGE_DIMENSION = 2000
+
+# Resolution used when rasterizing PDF pages for OCR
+PDF_DPI = 300
+
+# One single-threaded Tesseract per worker process; created on first batch,
+# possibly by two job threads at once. Every gunicorn worker has its own pool,
+# so by default the pools of 4 workers add up to about one process per CPU
+OCR_POOL_WORKERS = int(os.environ.get('OCR_POOL_WORKERS', max(1, (os.cpu_count() or 1) // 4)))
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    """Return the process pool used for batch OCR, creating it if needed."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(max_workers=OCR_POOL_WORKERS)
+    return _ocr_pool
+
+def _get_tess_api():
+    """Return this process's tesserocr engine, loading the model on first use."""
+    global _tess_api
+    if _tess_api is None:
+        kwargs = {'lang': 'eng', 'oem': OEM.LSTM_ONLY}
+        if TESSDATA_PREFIX:
+            kwargs['path'] = TESSDATA_PREFIX
+        _tess_api = PyTessBaseAPI(**kwargs)
+    return _tess_api
+
+def run_tesseract(image, psm):
+    """Run one Tesseract pass over a PIL image with the given page segmentation mode."""
+    if TESSEROCR_AVAILABLE:
+        with _tess_lock:
+            api = _get_tess_api()
+            api.SetPageSegMode(psm)
+            api.SetImage(image)
+            return api.GetUTF8Text()
+    return pytesseract.image_to_string(image, config=f'--oem {OCR_ENGINE_MODE} --psm {psm}')
+
+# Decode-time downscaling flags, largest reduction first
+REDUCED_READ_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def _reduced_read_flag(image_data):
+    """
+    Pick the largest decode-time reduction that keeps the image at or above
+    MAX_IMAGE_DIMENSION, so libjpeg can skip work instead of decoding at
+    full size and resizing afterwards. Other formats are decoded at full size
+    by OpenCV either way and then decimated, so they keep IMREAD_COLOR and
+    the INTER_AREA resize.
+    """
+    try:
+        # PIL only parses the header here; pixel data is not decoded
+        source = image_data if isinstance(image_data, (str, os.PathLike)) else io.BytesIO(image_data)
+        with Image.open(source) as header:
+            if header.format != 'JPEG':
+                return cv2.IMREAD_COLOR
+            longest_side = max(header.size)
+    except Exception:
+        return cv2.IMREAD_COLOR
+    
+    for factor, flag in REDUCED_READ_FLAGS:
+        if longest_side // factor >= MAX_IMAGE_DIMENSION:
+            return flag
+    return cv2.IMREAD_COLOR
 
 def preprocess_image(image_data):
     """
     Preprocess the image for better OCR results.
     
     Args:
-        image_data: The binary image data
+        image_data: The binary image data, or the path of an image file
         
     Returns:
         Preprocessed image as a numpy array
     """
     try:
-        # Convert binary data to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        
-        # Decode image
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Decode image; files are read by OpenCV without a Python bytes copy
+        read_flag = _reduced_read_flag(image_data)
+        if isinstance(image_data, (str, os.PathLike)):
+            img = cv2.imread(os.fspath(image_data), read_flag)
+        else:
+            img = cv2.imdecode(np.frombuffer(image_data, np.uint8), read_flag)
         if img is None:
             raise ValueError("Failed to decode image data")
         
+        # Downscale oversized images (e.g. 12MP phone photos)
+        height, width = img.shape[:2]
+        if max(height, width) > MAX_IMAGE_DIMENSION:
+            scale = MAX_IMAGE_DIMENSION / max(height, width)
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            logger.debug(f"Resized image from {width}x{height} by factor {scale:.2f}")
+        
         # Convert to grayscale
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
-        # Apply adaptive thresholding instead of global thresholding
-        # This handles varying illumination better
-        adaptive_thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY, 11, 2
-        )
-        
-        # Apply bilateral filter to reduce noise while preserving edges
-        filtered = cv2.bilateralFilter(adaptive_thresh, 9, 75, 75)
-        
-        # Increase contrast
+        # Increase contrast before binarizing
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
         enhanced = clahe.apply(gray)
         
+        # Otsu picks a global threshold from the contrast-equalized histogram
+        _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        
         # Apply dilation to make text more clear
         kernel = np.ones((2, 2), np.uint8)
-        dilated = cv2.dilate(filtered, kernel, iterations=1)
+        dilated = cv2.dilate(thresh, kernel, iterations=1)
         
         # Create a PIL Image from the processed image for better compatibility with pytesseract
         pil_image = Image.fromarray(dilated)
@@ -67,7 +175,10 @@ def preprocess_image(image_data):
         logger.error(f"Error preprocessing image: {str(e)}")
         # If there's an error in preprocessing, try to return the original image
         try:
-            image = Image.open(io.BytesIO(image_data))
+            if isinstance(image_data, (str, os.PathLike)):
+                image = Image.open(image_data)
+            else:
+                image = Image.open(io.BytesIO(image_data))
             logger.info("Falling back to original image without preprocessing")
             return image
         except Exception as fallback_e:
@@ -79,7 +190,7 @@ def process_image(image_data):
     Process the image with OCR to extract text.
     
     Args:
-        image_data: The binary image data
+        image_data: The binary image data, or the path of an image file
         
     Returns:
         Extracted text from the image
@@ -88,50 +199,59 @@ def process_image(image_data):
         # Preprocess the image
         processed_image = preprocess_image(image_data)
         
-        # Try multiple Tesseract configurations for best results
+        # Each Tesseract pass redoes layout analysis and LSTM recognition,
+        # so run one pass and only retry when it yields no meaningful text
         all_text = ""
-        
-        # Try with different PSM (Page Segmentation Modes)
-        for psm in [4, 6, 3, 1]:
-            # For PSM modes:
-            # 1 = Auto OSD
-            # 3 = Fully automatic page segmentation, but no OSD (default)
-            # 4 = Assume a single column of text of variable sizes
-            # 6 = Assume a single uniform block of text
-            
-            for oem in [1, 3]:
-                # For OEM modes:
-                # 1 = Neural nets LSTM engine only
-                # 3 = Default, based on what is available
-                
-                custom_config = f'--oem {oem} --psm {psm}'
-                
-                try:
-                    logger.debug(f"Trying OCR with config: {custom_config}")
-                    text = pytesseract.image_to_string(processed_image, config=custom_config)
-                    
-                    # If we got meaningful text, add it to our results
-                    if text and not text.isspace() and len(text.strip()) > 10:
-                        all_text = text
-                        logger.debug(f"Successful extraction with config: {custom_config}")
-                        break
-                except Exception as config_error:
-                    logger.warning(f"OCR attempt failed with config {custom_config}: {str(config_error)}")
-            
-            # If we have good text, stop trying configurations
-            if all_text:
-                break
-        
-        # If all OCR attempts failed, try one more time with default settings
-        if not all_text:
-            logger.warning("All configured OCR attempts failed, trying default settings")
+        for psm in PAGE_SEG_MODES:
             try:
-                all_text = pytesseract.image_to_string(processed_image)
-            except Exception as e:
-                logger.error(f"Default OCR attempt failed: {str(e)}")
-                
+                logger.debug(f"Trying OCR with PSM {psm}")
+                text = run_tesseract(processed_image, psm)
+                if text and len(text.strip()) >= MIN_TEXT_LENGTH:
+                    all_text = text
+                    logger.debug(f"Successful extraction with PSM {psm}")
+                    break
+                # Keep short output in case the fallback does no better
+                all_text = all_text or text.strip()
+            except Exception as config_error:
+                logger.warning(f"OCR attempt failed with PSM {psm}: {str(config_error)}")
+
         logger.debug(f"Extracted text: {all_text[:100]}...")
         return all_text or "No text could be extracted from the image."
     except Exception as e:
         logger.error(f"Error in OCR processing: {str(e)}")
         raise Exception(f"OCR processing failed: {str(e)}")
+
+def process_images_batch(images):
+    """
+    Process several images with OCR in parallel worker processes.
+    
+    Args:
+        images: List of binary image data or image file paths
+        
+    Returns:
+        List of extracted text, in the same order as the input
+    """
+    if len(images) <= 1:
+        return [process_image(image) for image in images]
+    return list(get_ocr_pool().map(process_image, images))
+
+def process_pdf(pdf_path):
+    """
+    Rasterize each page of a PDF and process the pages with OCR in parallel.
+    
+    Args:
+        pdf_path: Path of the PDF file
+        
+    Returns:
+        Extracted text of all pages, separated by blank lines
+    """
+    if not PDF2IMAGE_AVAILABLE:
+        raise Exception("PDF processing requires the pdf2image package")
+    
+    with tempfile.TemporaryDirectory() as output_folder:
+        page_paths = convert_from_path(pdf_path, dpi=PDF_DPI, fmt='png',
+                                       output_folder=output_folder, paths_only=True)
+        logger.debug(f"Split PDF into {len(page_paths)} pages")
+        page_texts = process_images_batch(page_paths)
+    
+    return "\n\n".join(page_texts)
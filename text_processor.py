@@ -1,164 +1,483 @@
 import re
+import string
 import json
 import os
 import logging
-import spacy
+import functools
+import threading
+import copy
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-logger = logging.getLogger(__name__)
+# pyahocorasick is optional; it finds all MEDICAL_TERMS literals in one pass
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
 
-# Load medical terminology
+# Hyperscan is optional; it lets one scan rule out extractors with no possible match
 try:
-    with open('medical_terms.json', 'r') as f:
-        MEDICAL_TERMS = json.load(f)
-except FileNotFoundError:
-    # If file doesn't exist, create a basic version
-    MEDICAL_TERMS = {
-        "medications": [],
-        "common_dosages": ["mg", "mcg", "ml", "g", "tablet", "capsule", "injection", "daily", "twice daily", "three times daily"],
-        "lab_test_names": [],
-        "vital_signs": ["BP", "blood pressure", "heart rate", "pulse", "temperature", "respiratory rate", "SpO2", "oxygen saturation"],
-        "medical_abbreviations": {
-            "qd": "once daily",
-            "bid": "twice daily",
-            "tid": "three times daily",
-            "qid": "four times daily",
-            "prn": "as needed",
-            "po": "by mouth",
-            "sc": "subcutaneous",
-            "im": "intramuscular",
-            "iv": "intravenous"
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Medical terminology is loaded on first use, so importing this module does
+# not read and compile it
+MEDICAL_TERMS_PATH = 'medical_terms.json'
+
+@functools.lru_cache(maxsize=1)
+def _medical_terms():
+    """Load the medical terminology, creating a basic file if it is missing."""
+    try:
+        with open(MEDICAL_TERMS_PATH, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        # If file doesn't exist, create a basic version
+        medical_terms = {
+            "medications": [],
+            "common_dosages": ["mg", "mcg", "ml", "g", "tablet", "capsule", "injection", "daily", "twice daily", "three times daily"],
+            "lab_test_names": [],
+            "vital_signs": ["BP", "blood pressure", "heart rate", "pulse", "temperature", "respiratory rate", "SpO2", "oxygen saturation"],
+            "medical_abbreviations": {
+                "qd": "once daily",
+                "bid": "twice daily",
+                "tid": "three times daily",
+                "qid": "four times daily",
+                "prn": "as needed",
+                "po": "by mouth",
+                "sc": "subcutaneous",
+                "im": "intramuscular",
+                "iv": "intravenous"
+            }
         }
+        # Save the basic version
+        with open(MEDICAL_TERMS_PATH, 'w') as f:
+            json.dump(medical_terms, f, indent=2)
+        return medical_terms
+
+def __getattr__(name):
+    # MEDICAL_TERMS stays importable as a module attribute
+    if name == "MEDICAL_TERMS":
+        return _medical_terms()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _build_automaton(terms):
+    """Build an Aho-Corasick automaton over the lowercased terms, or None."""
+    if not AHOCORASICK_AVAILABLE or not terms:
+        return None
+    automaton = ahocorasick.Automaton()
+    for term in terms:
+        automaton.add_word(term.lower(), term.lower())
+    automaton.make_automaton()
+    return automaton
+
+@functools.lru_cache(maxsize=1)
+def _term_lookups():
+    """Compile the patterns and automata derived from the medical terminology."""
+    terms = _medical_terms()
+    
+    # All known medication names as one alternation, longest first so a name is
+    # never cut short by a shorter one; matches map back to the listed spelling.
+    # For ASCII text the lowercase alternation runs on the lowercased text,
+    # which is much faster than re.IGNORECASE for a long alternation of
+    # literals; other text needs IGNORECASE, whose case folding differs from
+    # str.lower() for characters such as 'İ' and 'ſ'
+    medication_names = {med.lower(): med for med in terms.get("medications", [])}
+    medications_source = r'\b(?:' + '|'.join(
+        re.escape(med) for med in sorted(medication_names, key=len, reverse=True)
+    ) + r')\b'
+    
+    abbreviation_res = [
+        (abbr, abbr.lower(), full_text, re.compile(r'\b' + re.escape(abbr) + r'\b', re.IGNORECASE))
+        for abbr, full_text in terms.get("medical_abbreviations", {}).items()
+    ]
+    abbreviation_keys = sorted({abbr_lower for _, abbr_lower, _, _ in abbreviation_res}, key=len, reverse=True)
+    
+    return {
+        "medication_names": medication_names,
+        "medications_re": re.compile(medications_source) if medication_names else None,
+        "medications_ignorecase_re": re.compile(medications_source, re.IGNORECASE) if medication_names else None,
+        # Look for patterns like "X mg" or "X tablet(s)"
+        "dosage_re": re.compile(
+            r'\b\w+\s+\d+\s*(?:' + '|'.join(map(re.escape, terms.get("common_dosages", []))) + r')\b',
+            re.IGNORECASE
+        ),
+        # Known lab test names, lowercased, with the pattern for the value following each name
+        "lab_test_res": [
+            (test_name, test_name.lower(), re.compile(fr'{re.escape(test_name)}[:\s]*(\d+\.?\d*)\s*([A-Za-z/%]+)', re.IGNORECASE))
+            for test_name in terms.get("lab_test_names", [])
+        ],
+        # Medication abbreviations, lowercased, with their expansions
+        "abbreviation_res": abbreviation_res,
+        # All abbreviations as one lookahead alternation, longest first, so one
+        # scan finds them at every position; an abbreviation that is a prefix
+        # of a longer one can be hidden by it and is rechecked on its own
+        "abbreviations_re": re.compile(
+            r'(?=\b(' + '|'.join(map(re.escape, abbreviation_keys)) + r')\b)', re.IGNORECASE
+        ) if abbreviation_keys else None,
+        "prefix_abbreviation_res": [
+            (abbr_lower, pattern) for _, abbr_lower, _, pattern in abbreviation_res
+            if any(key != abbr_lower and key.startswith(abbr_lower) for key in abbreviation_keys)
+        ],
+        "medications_ac": _build_automaton(terms.get("medications", [])),
+        "lab_tests_ac": _build_automaton(terms.get("lab_test_names", [])),
+        "abbreviations_ac": _build_automaton(terms.get("medical_abbreviations", {})),
     }
-    # Save the basic version
-    with open('medical_terms.json', 'w') as f:
-        json.dump(MEDICAL_TERMS, f, indent=2)
 
-# Initialize spaCy if available
-try:
-    nlp = spacy.load("en_core_web_sm")
-    SPACY_AVAILABLE = True
-except (ImportError, OSError):
-    SPACY_AVAILABLE = False
+# ASCII characters matched by \w; _find_terms only scans ASCII text
+ASCII_WORD_CHARS = frozenset(string.ascii_letters + string.digits + '_')
+
+def _find_terms(automaton, text, word_bounded=True, text_lower=None):
+    """
+    Return the lowercased terms found in text, in text order, in one automaton
+    pass, or None when the regex path must be used instead. Only ASCII text is scanned:
+    lowercasing it keeps offsets aligned and matches re.IGNORECASE exactly.
+    text_lower is text.lower() if the caller already has it.
+    """
+    if automaton is None or not text.isascii():
+        return None
+    if text_lower is None:
+        text_lower = text.lower()
+    
+    # Padding with a non-word character on both sides lets \b be checked
+    # without bounds tests: text_lower[i] is padded[i + 1]
+    padded = f" {text_lower} "
+    found = {}
+    for end, term in automaton.iter(text_lower):
+        if term in found:
+            continue
+        start = end - len(term) + 1
+        if not word_bounded or (
+            (padded[start] in ASCII_WORD_CHARS) != (padded[start + 1] in ASCII_WORD_CHARS)
+            and (padded[end + 1] in ASCII_WORD_CHARS) != (padded[end + 2] in ASCII_WORD_CHARS)
+        ):
+            found[term] = None
+    return found
+
+# spaCy is loaded on first use; only the entity recognizer is needed
+SPACY_MODEL = "en_core_web_sm"
+SPACY_DISABLED_COMPONENTS = ["tagger", "parser", "lemmatizer", "attribute_ruler"]
+SPACY_BATCH_SIZE = int(os.environ.get("SPACY_BATCH_SIZE", 32))
+SPACY_AVAILABLE = bool(importlib.util.find_spec("spacy") and importlib.util.find_spec(SPACY_MODEL))
+if not SPACY_AVAILABLE:
     logger.warning("spaCy model not available. Using regex-based extraction only.")
 
-def extract_dates(text):
-    """Extract dates from text using regex patterns"""
-    # Various date formats
-    date_patterns = [
-        r'\b\d{1,2}/\d{1,2}/\d{2,4}\b',  # MM/DD/YYYY or DD/MM/YYYY
-        r'\b\d{1,2}-\d{1,2}-\d{2,4}\b',  # MM-DD-YYYY or DD-MM-YYYY
-        r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2},? \d{4}\b',  # Month DD, YYYY
-        r'\b\d{1,2} (?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{4}\b',  # DD Month YYYY
-    ]
+@functools.lru_cache(maxsize=None)
+def _get_nlp():
+    """Load the spaCy pipeline once, or return None if it cannot be loaded."""
+    global SPACY_AVAILABLE
+    try:
+        import spacy
+        return spacy.load(SPACY_MODEL, disable=SPACY_DISABLED_COMPONENTS)
+    except (ImportError, OSError) as e:
+        SPACY_AVAILABLE = False
+        logger.warning(f"spaCy model could not be loaded: {str(e)}. Using regex-based extraction only.")
+        return None
+
+def _spacy_doc(text):
+    """Parse text with spaCy when it is available, otherwise return None."""
+    if not SPACY_AVAILABLE:
+        return None
+    nlp = _get_nlp()
+    return nlp(text) if nlp else None
+
+def _spacy_medications(doc):
+    """Return PRODUCT entities of a spaCy Doc, which might be medications."""
+    return [ent.text for ent in doc.ents if ent.label_ == "PRODUCT"]
+
+def _spacy_diagnoses(doc):
+    """Return DISEASE/CONDITION entities of a spaCy Doc."""
+    return [ent.text for ent in doc.ents if ent.label_ in ["DISEASE", "CONDITION"]]
+
+def _fuse_by_priority(alternatives, flags=0):
+    """
+    Fuse (prefix, capture) pairs into one pattern whose alternatives capture
+    into groups p0, p1, ... in priority order. The lookahead makes every start
+    position a candidate, so overlapping alternatives are all seen in one scan.
+    """
+    return re.compile('(?=' + '|'.join(
+        f'{prefix}(?P<p{rank}>{capture})' for rank, (prefix, capture) in enumerate(alternatives)
+    ) + ')', flags)
+
+def _first_by_priority(pattern, text):
+    """Return the capture of the highest-priority alternative found in text, or None."""
+    best_rank, best_value = None, None
+    for match in pattern.finditer(text):
+        rank = int(match.lastgroup[1:])
+        if rank == 0:
+            return match.group(match.lastgroup)
+        if best_rank is None or rank < best_rank:
+            best_rank, best_value = rank, match.group(match.lastgroup)
+    return best_value
+
+# Various date formats
+DATES_RE = re.compile('|'.join((
+    r'\b\d{1,2}/\d{1,2}/\d{2,4}\b',  # MM/DD/YYYY or DD/MM/YYYY
+    r'\b\d{1,2}-\d{1,2}-\d{2,4}\b',  # MM-DD-YYYY or DD-MM-YYYY
+    r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2},? \d{4}\b',  # Month DD, YYYY
+    r'\b\d{1,2} (?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{4}\b',  # DD Month YYYY
+)), re.IGNORECASE)
+
+# A capitalized name of two or three words
+PERSON_NAME = r'[A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,2}'
+
+# "Dr." or "Doctor" followed by a name
+DOCTOR_RE = _fuse_by_priority([
+    (r'(?:Dr\.|Doctor)\s+', PERSON_NAME),
+    (r'(?:Physician|Provider):\s*', PERSON_NAME)
+])
+# Literals, one of which any DOCTOR_RE match contains
+DOCTOR_KEYWORDS = ("Dr.", "Doctor", "Physician", "Provider")
+
+PHONE_RE = re.compile(
+    r'(?:Phone|Tel|Contact)(?::|number)?[:\s]*(\(\d{3}\)\s*\d{3}-\d{4}|\d{3}[-.\s]\d{3}[-.\s]\d{4}|\d{10})',
+    re.IGNORECASE
+)
+# Lowercase literals, one of which any PHONE_RE match contains
+PHONE_KEYWORDS = ("phone", "tel", "contact")
+
+PATIENT_NAME_RE = _fuse_by_priority([
+    (r'(?:Patient|Name):\s*', PERSON_NAME),
+    (r'(?:Patient|Name)[:\s]+', PERSON_NAME)
+], re.IGNORECASE)
+
+DOB_RE = _fuse_by_priority([
+    (r'(?:DOB|Date of Birth)[:\s]*', r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}'),
+    (r'(?:Born|Birth)[:\s]*', r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}')
+], re.IGNORECASE)
+
+PATIENT_ID_RE = _fuse_by_priority([
+    (r'(?:ID|Patient ID|MRN)[:\s]*', r'[A-Z0-9-]+'),
+    (r'(?:Medical Record Number)[:\s]*', r'[A-Z0-9-]+')
+], re.IGNORECASE)
+
+# Patient fields with their patterns and the lowercase literals, one of which
+# any match contains. The patterns are caseless, and re.IGNORECASE folds a few
+# non-ASCII characters (such as 'İ' to 'i') unlike str.lower(), so the
+# literals only rule out matches in ASCII text
+PATIENT_FIELDS = (
+    ("name", PATIENT_NAME_RE, ("patient", "name")),
+    ("dob", DOB_RE, ("dob", "birth", "born")),
+    ("id", PATIENT_ID_RE, ("id", "mrn", "medical record number")),
+)
+
+# "Test Name: XX.X unit" or "Test Name XX.X unit". The name is bounded and
+# possessive: an unbounded run retried from every start position made long
+# colon-free text quadratic, and giving back letters can never produce ':'.
+# It starts after a non-letter so that a name over the bound loses whole
+# leading words; OCR output often glues a name to the preceding digits
+LAB_RESULT_RE = re.compile(r'(?<![A-Za-z])([A-Za-z][A-Za-z\s]{0,63}+):\s*(\d+\.?\d*)\s*([A-Za-z/%]+)')
+
+# Common instructional phrases; for "Take ... daily" only the frequency is kept.
+# Trailing runs to the end of the clause are possessive so they never backtrack.
+# Each pattern is scanned on its own rather than as one alternation: a match
+# runs to the end of its clause, which can hold another pattern's match
+INSTRUCTIONS_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:Take|Use|Apply)[^.;]+(daily|twice daily|three times daily|every \d+ hours)[^.;]++',
+    r'Instructions?:[^.;]++',
+    r'Directions?:[^.;]++'
+))
+
+# Diagnosis sections, scanned on their own like the instructions
+DIAGNOSES_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'Diagnosis(?:es)?:[^.;]++',
+    r'Assessment:[^.;]++',
+    r'Condition(?:s)?:[^.;]++'
+))
+
+# Result keys whose extractors also use spaCy and so cannot be skipped on regex alone
+SPACY_ENTITY_KEYS = {"medications", "diagnoses"}
+
+# Result keys whose extractors take the lowercased text computed once per document
+TEXT_LOWER_KEYS = {"patient_info", "medications", "doctor_info", "lab_results", "instructions"}
+
+def _prefilter_patterns():
+    """
+    Pair each result key with the compiled patterns that can produce it and
+    whether the pattern matches caselessly.
+    """
+    lookups = _term_lookups()
+    groups = {
+        "dates": [DATES_RE],
+        "patient_info": [PATIENT_NAME_RE, DOB_RE, PATIENT_ID_RE],
+        "medications": [lookups["dosage_re"]],
+        "doctor_info": [DOCTOR_RE, PHONE_RE],
+        "instructions": [*INSTRUCTIONS_RES, lookups["abbreviations_re"]],
+        "lab_results": [LAB_RESULT_RE] + [pattern for *_, pattern in lookups["lab_test_res"]],
+        "diagnoses": list(DIAGNOSES_RES),
+    }
+    patterns = [(key, pattern, bool(pattern.flags & re.IGNORECASE))
+                for key, group in groups.items() for pattern in group if pattern]
+    # The lowercase medication alternation is run on the lowercased text
+    if lookups["medications_re"]:
+        patterns.append(("medications", lookups["medications_re"], True))
+    return patterns
+
+# The '+' that makes a preceding quantifier possessive
+POSSESSIVE_RE = re.compile(r'(?<=[+*?}])\+')
+# A lookbehind at the start of a pattern, without nested groups
+LEADING_LOOKBEHIND_RE = re.compile(r'^\(\?<[=!][^()]*\)')
+
+@functools.lru_cache(maxsize=1)
+def _get_prefilter():
+    """Compile every extractor pattern into one Hyperscan database on first use, or None."""
+    if not HYPERSCAN_AVAILABLE:
+        return None, []
+    
+    keys, expressions, flags = [], [], []
+    for key, pattern, caseless in _prefilter_patterns():
+        source = pattern.pattern
+        # Hyperscan has no lookahead; a fused pattern's body matches the same text
+        if source.startswith('(?=') and source.endswith(')'):
+            source = source[3:-1]
+        # Nor possessive quantifiers; ours only guard backtracking that cannot
+        # change whether a match exists, so the greedy form is equivalent here
+        source = POSSESSIVE_RE.sub('', source)
+        # Nor lookbehind; without a leading one a pattern matches more text,
+        # never less, which is all a prefilter needs
+        source = LEADING_LOOKBEHIND_RE.sub('', source)
+        flag = hyperscan.HS_FLAG_SINGLEMATCH
+        if caseless:
+            flag |= hyperscan.HS_FLAG_CASELESS
+        keys.append(key)
+        expressions.append(source.encode('utf-8'))
+        flags.append(flag)
     
-    dates = []
-    for pattern in date_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        dates.extend(matches)
+    try:
+        database = hyperscan.Database()
+        database.compile(expressions=expressions, ids=list(range(len(expressions))), flags=flags)
+        return database, keys
+    except Exception as e:
+        logger.warning(f"Hyperscan prefilter unavailable: {str(e)}")
+        return None, []
+
+# A Hyperscan scratch space serves one scan at a time, so each thread keeps
+# its own for the shared database
+_prefilter_local = threading.local()
+
+def _prefilter_scratch(database):
+    """Return this thread's scratch space for the prefilter database."""
+    scratch = getattr(_prefilter_local, "scratch", None)
+    if scratch is None:
+        scratch = _prefilter_local.scratch = hyperscan.Scratch(database)
+    return scratch
+
+def prefilter_hits(text):
+    """
+    Return the result keys that have at least one pattern match in text, from
+    a single Hyperscan pass, or None when the prefilter is unavailable.
+    
+    Hyperscan patterns are compiled in ASCII mode, where word boundaries,
+    character classes and case folding agree with Python's re only for ASCII
+    input, so other text is not prefiltered.
+    """
+    if not HYPERSCAN_AVAILABLE or not text.isascii():
+        return None
+    database, keys = _get_prefilter()
+    if database is None:
+        return None
+    
+    hits = set()
     
-    return dates
+    def on_match(pattern_id, start, end, flags, context):
+        hits.add(keys[pattern_id])
+    
+    try:
+        database.scan(text.encode('ascii'), match_event_handler=on_match, scratch=_prefilter_scratch(database))
+    except Exception as e:
+        logger.warning(f"Hyperscan scan failed, running all extractors: {str(e)}")
+        return None
+    return hits
+
+def _add_unique(unique, items):
+    """Add items to the dict unique keyed by their lowercased text, keeping the first spelling."""
+    for item in items:
+        unique.setdefault(item.lower(), item)
+    return unique
+
+def extract_dates(text):
+    """Extract dates from text using regex patterns"""
+    return list(_add_unique({}, (match.group(0) for match in DATES_RE.finditer(text))).values())
+
+def _term_key(terms, matched):
+    """Return the lowercased term of terms that a caseless regex match stands for."""
+    key = matched.lower()
+    if key in terms:
+        return key
+    # Case folding that str.lower() does not reproduce
+    return next(term for term in terms if re.fullmatch(re.escape(term), matched, re.IGNORECASE))
 
-def extract_medications(text):
-    """Extract medication names and dosages"""
-    medications = []
+def extract_medications(text, text_lower=None, doc=None):
+    """Extract medication names and dosages, and PRODUCT entities of the spaCy doc if given"""
+    lookups = _term_lookups()
+    medications = {}
+    if text_lower is None:
+        text_lower = text.lower()
     
-    # Check for common medication names from our database
-    for med in MEDICAL_TERMS.get("medications", []):
-        if re.search(r'\b' + re.escape(med) + r'\b', text, re.IGNORECASE):
-            medications.append(med)
+    # Check for common medication names from our database in a single pass
+    found = _find_terms(lookups["medications_ac"], text, text_lower=text_lower)
+    if found is None and lookups["medications_re"]:
+        if text.isascii():
+            found = dict.fromkeys(match.group(0) for match in lookups["medications_re"].finditer(text_lower))
+        else:
+            found = dict.fromkeys(_term_key(lookups["medication_names"], match.group(0))
+                                  for match in lookups["medications_ignorecase_re"].finditer(text))
+    _add_unique(medications, (lookups["medication_names"][med] for med in found or ()))
     
     # Look for patterns like "X mg" or "X tablet(s)"
-    dosage_pattern = r'\b\w+\s+\d+\s*(?:' + '|'.join(MEDICAL_TERMS.get("common_dosages", [])) + r')\b'
-    dosage_matches = re.findall(dosage_pattern, text, re.IGNORECASE)
-    medications.extend(dosage_matches)
+    _add_unique(medications, (match.group(0) for match in lookups["dosage_re"].finditer(text)))
     
-    # Use spaCy if available
-    if SPACY_AVAILABLE:
-        doc = nlp(text)
-        
-        # Look for PROPN (proper noun) entities that might be medications
-        potential_meds = [ent.text for ent in doc.ents if ent.label_ == "PRODUCT"]
-        medications.extend(potential_meds)
+    if doc is not None:
+        _add_unique(medications, _spacy_medications(doc))
     
-    return list(set(medications))  # Remove duplicates
+    return list(medications.values())
 
-def extract_doctor_info(text):
+def extract_doctor_info(text, text_lower=None):
     """Extract doctor name and information"""
     doctor_info = {}
     
-    # Look for "Dr." or "Doctor" followed by a name
-    doctor_patterns = [
-        r'(?:Dr\.|Doctor)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,2})',
-        r'(?:Physician|Provider):\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,2})'
-    ]
-    
-    for pattern in doctor_patterns:
-        match = re.search(pattern, text)
-        if match:
-            doctor_info["name"] = match.group(1)
-            break
+    name = any(k in text for k in DOCTOR_KEYWORDS) and _first_by_priority(DOCTOR_RE, text)
+    if name:
+        doctor_info["name"] = name
     
-    # Look for phone numbers
-    phone_pattern = r'(?:Phone|Tel|Contact)(?::|number)?[:\s]*(\(\d{3}\)\s*\d{3}-\d{4}|\d{3}[-.\s]\d{3}[-.\s]\d{4}|\d{10})'
-    phone_match = re.search(phone_pattern, text, re.IGNORECASE)
+    # Look for phone numbers, skipping the regex when no keyword is present
+    if text_lower is None:
+        text_lower = text.lower()
+    phone_match = any(k in text_lower for k in PHONE_KEYWORDS) and PHONE_RE.search(text)
     if phone_match:
         doctor_info["phone"] = phone_match.group(1)
     
     return doctor_info
 
-def extract_patient_info(text):
+def extract_patient_info(text, text_lower=None):
     """Extract patient information"""
     patient_info = {}
+    if text_lower is None:
+        text_lower = text.lower()
+    ascii_text = text.isascii()
     
-    # Look for patient name
-    name_patterns = [
-        r'(?:Patient|Name):\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,2})',
-        r'(?:Patient|Name)[:\s]+([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,2})'
-    ]
-    
-    for pattern in name_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            patient_info["name"] = match.group(1)
-            break
-    
-    # Look for dates of birth
-    dob_patterns = [
-        r'(?:DOB|Date of Birth)[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',
-        r'(?:Born|Birth)[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})'
-    ]
-    
-    for pattern in dob_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            patient_info["dob"] = match.group(1)
-            break
-    
-    # Look for patient ID
-    id_patterns = [
-        r'(?:ID|Patient ID|MRN)[:\s]*([A-Z0-9-]+)',
-        r'(?:Medical Record Number)[:\s]*([A-Z0-9-]+)'
-    ]
-    
-    for pattern in id_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            patient_info["id"] = match.group(1)
-            break
+    # Look for patient name, date of birth and patient ID
+    for key, pattern, keywords in PATIENT_FIELDS:
+        if ascii_text and not any(k in text_lower for k in keywords):
+            continue
+        value = _first_by_priority(pattern, text)
+        if value:
+            patient_info[key] = value
     
     return patient_info
 
-def extract_lab_results(text):
+def extract_lab_results(text, text_lower=None):
     """Extract lab test results"""
     lab_results = []
     
-    # Look for patterns like "Test Name: XX.X unit" or "Test Name XX.X unit"
-    result_pattern = r'([A-Za-z\s]+):\s*(\d+\.?\d*)\s*([A-Za-z/%]+)'
-    matches = re.findall(result_pattern, text)
-    
-    for match in matches:
-        test_name, value, unit = match
+    # "Name: value unit" needs a colon; a substring test is cheaper than the regex
+    for match in (LAB_RESULT_RE.finditer(text) if ':' in text else ()):
+        test_name, value, unit = match.groups()
         lab_results.append({
             "test": test_name.strip(),
             "value": value,
@@ -166,11 +485,16 @@ def extract_lab_results(text):
         })
     
     # Look for common lab test names
-    for test_name in MEDICAL_TERMS.get("lab_test_names", []):
-        if test_name.lower() in text.lower():
+    if text_lower is None:
+        text_lower = text.lower()
+    lookups = _term_lookups()
+    found = _find_terms(lookups["lab_tests_ac"], text, word_bounded=False, text_lower=text_lower)
+    if found is None:
+        found = {test_lower for _, test_lower, _ in lookups["lab_test_res"] if test_lower in text_lower}
+    for test_name, test_lower, value_pattern in lookups["lab_test_res"]:
+        if test_lower in found:
             # Find the value after the test name
-            value_pattern = fr'{re.escape(test_name)}[:\s]*(\d+\.?\d*)\s*([A-Za-z/%]+)'
-            value_match = re.search(value_pattern, text, re.IGNORECASE)
+            value_match = value_pattern.search(text)
             
             if value_match:
                 lab_results.append({
@@ -181,111 +505,234 @@ def extract_lab_results(text):
     
     return lab_results
 
-def extract_instructions(text):
+def _find_abbreviations(lookups, text):
+    """Return the lowercased abbreviations found in text by the regex alternation."""
+    if lookups["abbreviations_re"] is None:
+        return set()
+    keys = [abbr_lower for _, abbr_lower, _, _ in lookups["abbreviation_res"]]
+    found = {_term_key(keys, match.group(1)) for match in lookups["abbreviations_re"].finditer(text)}
+    for abbr_lower, pattern in lookups["prefix_abbreviation_res"]:
+        if abbr_lower not in found and pattern.search(text):
+            found.add(abbr_lower)
+    return found
+
+def extract_instructions(text, text_lower=None):
     """Extract medication instructions or physician instructions"""
-    instructions = []
+    instructions = {}
     
-    # Look for common instructional phrases
-    instruction_patterns = [
-        r'(?:Take|Use|Apply)[^.;]+(daily|twice daily|three times daily|every \d+ hours)[^.;]+',
-        r'Instructions?:[^.;]+',
-        r'Directions?:[^.;]+'
-    ]
-    
-    for pattern in instruction_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        instructions.extend(matches)
+    # A pattern with a group reports only the group (the frequency)
+    for pattern in INSTRUCTIONS_RES:
+        _add_unique(instructions, (match.group(1 if pattern.groups else 0) for match in pattern.finditer(text)))
     
     # Check for medication abbreviations and replace with full text
-    for abbr, full_text in MEDICAL_TERMS.get("medical_abbreviations", {}).items():
-        abbr_pattern = r'\b' + re.escape(abbr) + r'\b'
-        if re.search(abbr_pattern, text, re.IGNORECASE):
-            instructions.append(f"{abbr} ({full_text})")
-    
-    return instructions
-
-def extract_diagnoses(text):
-    """Extract diagnoses or conditions"""
-    diagnoses = []
-    
-    # Look for diagnosis sections
-    diagnosis_patterns = [
-        r'Diagnosis(?:es)?:[^.;]+',
-        r'Assessment:[^.;]+',
-        r'Condition(?:s)?:[^.;]+'
-    ]
+    lookups = _term_lookups()
+    if text_lower is None:
+        text_lower = text.lower()
+    found = _find_terms(lookups["abbreviations_ac"], text, text_lower=text_lower)
+    if found is None:
+        found = _find_abbreviations(lookups, text)
+    for abbr, abbr_lower, full_text, _ in lookups["abbreviation_res"]:
+        if abbr_lower in found:
+            instructions.setdefault(f"{abbr_lower} ({full_text.lower()})", f"{abbr} ({full_text})")
     
-    for pattern in diagnosis_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        diagnoses.extend(matches)
+    return list(instructions.values())
+
+def extract_diagnoses(text, doc=None):
+    """Extract diagnoses or conditions, and DISEASE/CONDITION entities of the spaCy doc if given"""
+    diagnoses = {}
+    for pattern in DIAGNOSES_RES:
+        _add_unique(diagnoses, (match.group(0) for match in pattern.finditer(text)))
     
-    # If we have spaCy, try to extract medical conditions
-    if SPACY_AVAILABLE:
-        doc = nlp(text)
-        
-        # Look for entities that might be medical conditions
-        for ent in doc.ents:
-            if ent.label_ in ["DISEASE", "CONDITION"]:
-                diagnoses.append(ent.text)
+    if doc is not None:
+        _add_unique(diagnoses, _spacy_diagnoses(doc))
     
-    return diagnoses
+    return list(diagnoses.values())
+
+# Result keys and their extractors for each document type, in result order;
+# dates and patient info are extracted for all document types
+_COMMON_EXTRACTORS = (
+    ("dates", extract_dates),
+    ("patient_info", extract_patient_info),
+)
+_EXTRACTORS = {
+    "prescription": _COMMON_EXTRACTORS + (
+        ("medications", extract_medications),
+        ("doctor_info", extract_doctor_info),
+        ("instructions", extract_instructions),
+    ),
+    "lab_report": _COMMON_EXTRACTORS + (
+        ("lab_results", extract_lab_results),
+        ("doctor_info", extract_doctor_info),
+    ),
+    "medical_note": _COMMON_EXTRACTORS + (
+        ("diagnoses", extract_diagnoses),
+        ("doctor_info", extract_doctor_info),
+        ("medications", extract_medications),
+    ),
+    # For any other document type, extract everything
+    None: _COMMON_EXTRACTORS + (
+        ("medications", extract_medications),
+        ("doctor_info", extract_doctor_info),
+        ("instructions", extract_instructions),
+        ("lab_results", extract_lab_results),
+        ("diagnoses", extract_diagnoses),
+    ),
+}
+
+def _extractors_for(document_type):
+    """Return the (key, extractor) pairs used for a document type."""
+    return _EXTRACTORS.get(document_type, _EXTRACTORS[None])
 
-def extract_medical_entities(text, document_type):
+def _uses_spacy(document_type):
+    """Whether any extractor for the document type reads spaCy entities."""
+    return any(key in SPACY_ENTITY_KEYS for key, _ in _extractors_for(document_type))
+
+def extract_medical_entities(text, document_type, doc=None, lazy_spacy=True):
     """
     Extract medical entities from OCR text based on document type.
     
+    Results are cached per (text, document_type, lazy_spacy) unless a spaCy
+    doc is used; each call returns its own copy.
+    
     Args:
         text: The OCR-extracted text
         document_type: Type of medical document (prescription, lab_report, etc.)
+        doc: Optional spaCy Doc for text, e.g. from nlp.pipe; parsed here
+            if not given and lazy_spacy is off
+        lazy_spacy: Skip spaCy and use only the regex/term lookups; spaCy
+            entities can be added later with enrich_with_spacy
         
     Returns:
         Dictionary of extracted medical entities
     """
     try:
-        logger.debug(f"Processing text as {document_type}")
-        
-        # Common extractions for all document types
-        results = {
-            "dates": extract_dates(text),
-            "patient_info": extract_patient_info(text)
-        }
-        
-        # Document-specific extractions
-        if document_type == "prescription":
-            results.update({
-                "medications": extract_medications(text),
-                "doctor_info": extract_doctor_info(text),
-                "instructions": extract_instructions(text)
-            })
-        
-        elif document_type == "lab_report":
-            results.update({
-                "lab_results": extract_lab_results(text),
-                "doctor_info": extract_doctor_info(text)
-            })
+        if doc is not None and not lazy_spacy:
+            return _extract_medical_entities(text, document_type, doc, lazy_spacy)
+        return copy.deepcopy(_cached_medical_entities(text, document_type, lazy_spacy))
+    
+    except Exception as e:
+        logger.error(f"Error extracting medical entities: {str(e)}")
+        # Return at least the raw text if processing fails
+        return {"raw_text": text}
+
+# Retried jobs and repeated pages extract the same text again
+EXTRACTION_CACHE_SIZE = int(os.environ.get("EXTRACTION_CACHE_SIZE", 256))
+
+@functools.lru_cache(maxsize=EXTRACTION_CACHE_SIZE)
+def _cached_medical_entities(text, document_type, lazy_spacy):
+    """Cached _extract_medical_entities for texts without a spaCy doc; callers must not modify the result."""
+    return _extract_medical_entities(text, document_type, None, lazy_spacy)
+
+def _extract_medical_entities(text, document_type, doc, lazy_spacy):
+    """Extract the entities for extract_medical_entities, raising on errors."""
+    logger.debug(f"Processing text as {document_type}")
+    
+    # Extractors without a possible regex match are skipped; spaCy-backed
+    # ones still run when the text has been parsed
+    hits = prefilter_hits(text)
+    
+    # Lowercase and parse the text once for all extractors
+    text_lower = text.lower()
+    if lazy_spacy:
+        doc = None
+    elif doc is None and _uses_spacy(document_type):
+        doc = _spacy_doc(text)
+    
+    def extract(key, extractor):
+        kwargs = {"text_lower": text_lower} if key in TEXT_LOWER_KEYS else {}
+        if key in SPACY_ENTITY_KEYS:
+            if hits is None or key in hits or doc is not None:
+                return extractor(text, doc=doc, **kwargs)
+        elif hits is None or key in hits:
+            return extractor(text, **kwargs)
+        return None
+    
+    # Empty lists or dictionaries are left out
+    results = {}
+    for key, extractor in _extractors_for(document_type):
+        value = extract(key, extractor)
+        if value:
+            results[key] = value
+    
+    return results
+
+# Texts handed to each extraction worker at a time; smaller batches are
+# extracted in this process
+BATCH_CHUNK_SIZE = 16
+
+def extract_medical_entities_batch(texts, document_type, lazy_spacy=True, workers=None):
+    """
+    Extract medical entities from several OCR texts of the same document type.
+    
+    The regex/term extraction is spread over a pool of worker processes.
+    Unless lazy_spacy is set, spaCy then parses all texts in one nlp.pipe
+    pass over the same number of processes and its entities are merged in.
+    
+    Args:
+        texts: List of OCR-extracted texts
+        document_type: Type of medical document (prescription, lab_report, etc.)
+        lazy_spacy: Skip spaCy, as in extract_medical_entities
+        workers: Number of processes to use, by default one per CPU
         
-        elif document_type == "medical_note":
-            results.update({
-                "diagnoses": extract_diagnoses(text),
-                "doctor_info": extract_doctor_info(text),
-                "medications": extract_medications(text)
-            })
+    Returns:
+        List of dictionaries of extracted medical entities, one per text
+    """
+    texts = list(texts)
+    workers = workers or os.cpu_count() or 1
+    extract = functools.partial(extract_medical_entities, document_type=document_type, lazy_spacy=True)
+    if workers > 1 and len(texts) > BATCH_CHUNK_SIZE:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(extract, texts, chunksize=BATCH_CHUNK_SIZE))
+    else:
+        results = [extract(text) for text in texts]
+    
+    use_nlp = SPACY_AVAILABLE and not lazy_spacy and _uses_spacy(document_type)
+    nlp = _get_nlp() if use_nlp else None
+    if nlp is None:
+        return results
+    
+    n_process = min(workers, max(1, len(texts) // BATCH_CHUNK_SIZE))
+    docs = nlp.pipe(texts, batch_size=SPACY_BATCH_SIZE, n_process=n_process)
+    return [enrich_with_spacy(result, text, document_type, doc)
+            for result, text, doc in zip(results, texts, docs)]
+
+def enrich_with_spacy(results, text, document_type, doc=None):
+    """
+    Add spaCy entities to results from extract_medical_entities(lazy_spacy=True).
+    
+    Parses text once, unless its spaCy doc is given, and merges PRODUCT
+    entities into the medications and DISEASE/CONDITION entities into the
+    diagnoses of the document types that extract them. results itself is
+    left unchanged.
+    
+    Args:
+        results: Dictionary of extracted medical entities
+        text: The OCR-extracted text results were extracted from
+        document_type: Type of medical document (prescription, lab_report, etc.)
+        doc: Optional spaCy Doc for text, e.g. from nlp.pipe
         
-        else:  # For any other document type, extract everything
-            results.update({
-                "medications": extract_medications(text),
-                "doctor_info": extract_doctor_info(text),
-                "instructions": extract_instructions(text),
-                "lab_results": extract_lab_results(text),
-                "diagnoses": extract_diagnoses(text)
-            })
+    Returns:
+        Dictionary of extracted medical entities including spaCy entities
+    """
+    keys = {key for key, _ in _extractors_for(document_type)}
+    if not text or not keys & SPACY_ENTITY_KEYS:
+        return results
+    
+    try:
+        if doc is None:
+            doc = _spacy_doc(text)
+        if doc is None:
+            return results
         
-        # Remove empty lists or dictionaries
-        results = {k: v for k, v in results.items() if v}
+        enriched = dict(results)
+        for key, entities in (("medications", _spacy_medications), ("diagnoses", _spacy_diagnoses)):
+            found = entities(doc) if key in keys else None
+            if found:
+                merged = _add_unique(_add_unique({}, enriched.get(key, [])), found)
+                enriched[key] = list(merged.values())
         
-        return results
+        return enriched
     
     except Exception as e:
-        logger.error(f"Error extracting medical entities: {str(e)}")
-        # Return at least the raw text if processing fails
-        return {"raw_text": text}
+        logger.error(f"Error enriching medical entities with spaCy: {str(e)}")
+        return results